@@ -1,26 +1,64 @@
+import asyncio
+import hashlib
+import json
 import os
-from typing import List, Optional
 import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Optional, Tuple
 
+import numpy as np
 import torch
 from fastapi import FastAPI, HTTPException
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from sentence_transformers import SentenceTransformer
 from transformers import (
     AutoTokenizer,
     AutoModelForCausalLM,
     AutoModelForSeq2SeqLM,
-    BitsAndBytesConfig,
+    StoppingCriteria,
+    StoppingCriteriaList,
+    TextIteratorStreamer,
 )
 
 import chromadb
 
+try:
+    import ctranslate2
+except ImportError:  # Optional: fall back to HF Transformers translators
+    ctranslate2 = None
+
 VECTOR_DB_DIR = os.path.join(os.path.dirname(__file__), "vector_db")
 CHROMA_COLLECTION_NAME = "college_rag"
 
 EMBEDDING_MODEL_NAME = "BAAI/bge-m3"
-GENERATOR_MODEL_NAME = "Qwen/Qwen2.5-1.5B-Instruct"
+GENERATOR_MODEL_NAME = "Qwen/Qwen2.5-1.5B-Instruct-AWQ"
+
+TRANSLATOR_TR_EN_MODEL_NAME = "Helsinki-NLP/opus-mt-tr-en"
+TRANSLATOR_EN_TR_MODEL_NAME = "Helsinki-NLP/opus-mt-en-trk"
+
+# CTranslate2 int8 conversions of the translators (see README)
+MODELS_DIR = os.path.join(os.path.dirname(__file__), "models")
+TRANSLATOR_TR_EN_CT2_DIR = os.path.join(MODELS_DIR, "tr-en-ct2")
+TRANSLATOR_EN_TR_CT2_DIR = os.path.join(MODELS_DIR, "en-tr-ct2")
+
+# Semantic query cache: reuse answers for near-identical questions
+QUERY_CACHE_SIZE = 512
+QUERY_CACHE_THRESHOLD = 0.97
+
+# Return the top FAQ chunk's answer verbatim (skipping the LLM) above this cosine similarity
+DIRECT_ANSWER_THRESHOLD = 0.92
+
+# Generator worker: requests arriving within the window are batched together
+GENERATOR_MAX_BATCH_SIZE = 8
+GENERATOR_BATCH_WINDOW_SECONDS = 0.005
+
+# Max wait for the next streamed piece (covers queueing on the generator thread)
+STREAM_TIMEOUT_SECONDS = 120
 
 app = FastAPI(title="RAG Chatbot API")
 
@@ -48,6 +86,33 @@ class AppComponents:
     translator_en_tr_tokenizer = None
     translator_en_tr_model = None
 
+    # Semantic cache: query -> (embedding, context_chunks, sources, answer)
+    query_cache: "OrderedDict[str, Tuple[np.ndarray, List[str], List[dict], str]]" = (
+        OrderedDict()
+    )
+    # Stacked (N, d) embeddings of query_cache and the query of each row,
+    # rebuilt lazily after inserts (LRU reordering on hits keeps them valid)
+    query_cache_matrix = None
+    query_cache_keys: List[str] = []
+
+    # Translation cache: (text hash, src_lang, tgt_lang) -> translated text
+    translation_cache: dict = {}
+
+    # Generator worker: queue of (prompt ids, future) and the task consuming it
+    request_queue = None
+    generator_task = None
+    # The one thread that runs every generate call (compile warmup, batch
+    # worker, streams): compiled CUDA graphs are thread-local in torch
+    generator_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="generator")
+    # Set by compile_generator; enables shape bucketing for the CUDA graphs
+    generator_compiled = False
+
+    # Cached prompt token ids: language -> head ids, the suffix ids, and the
+    # newline ids re-appended after a truncated question
+    prompt_head_ids = None
+    prompt_suffix_ids = None
+    prompt_newline_ids = None
+
 
 components = AppComponents()
 
@@ -77,13 +142,24 @@ def initialize_components():
         )
         return
 
-    # Load Embedding Model (on CPU to save GPU for Qwen)
+    # Load Embedding Model (FP16 on GPU next to the 4-bit Qwen, else CPU)
     try:
-        components.embedding_model = SentenceTransformer(
-            EMBEDDING_MODEL_NAME,
-            device="cpu",
+        if components.device == "cuda":
+            components.embedding_model = SentenceTransformer(
+                EMBEDDING_MODEL_NAME,
+                device="cuda",
+                model_kwargs={"torch_dtype": torch.float16},
+            )
+            components.embedding_model.half()
+        else:
+            components.embedding_model = SentenceTransformer(
+                EMBEDDING_MODEL_NAME,
+                device="cpu",
+            )
+        print(
+            f"Embedding model loaded on {components.device.upper()}: "
+            f"{EMBEDDING_MODEL_NAME}"
         )
-        print(f"Embedding model loaded on CPU: {EMBEDDING_MODEL_NAME}")
     except Exception as e:
         print("CRITICAL: Failed to load embedding model.")
         print(f"Error: {e}")
@@ -95,40 +171,53 @@ def initialize_components():
             GENERATOR_MODEL_NAME
         )
 
-        bnb_config = BitsAndBytesConfig(
-            load_in_4bit=True,
-            bnb_4bit_compute_dtype=torch.float16,
-            bnb_4bit_use_double_quant=True,
-            bnb_4bit_quant_type="nf4",
-        )
-
+        # Pre-quantized AWQ int4 checkpoint; transformers picks the fused AWQ kernels
         components.generator_model = AutoModelForCausalLM.from_pretrained(
             GENERATOR_MODEL_NAME,
-            quantization_config=bnb_config,
+            torch_dtype=torch.float16,
             device_map="auto",
         )
 
         if components.generator_tokenizer.eos_token_id is None:
             components.generator_tokenizer.eos_token = "</s>"
 
-        print("Generator loaded (Qwen, 4-bit):", GENERATOR_MODEL_NAME)
+        # Batched generation with a decoder-only model needs left padding
+        components.generator_tokenizer.padding_side = "left"
+        if components.generator_tokenizer.pad_token_id is None:
+            components.generator_tokenizer.pad_token = components.generator_tokenizer.eos_token
+
+        cache_prompt_template_ids(components.generator_tokenizer)
+
+        print("Generator loaded (Qwen, AWQ int4):", GENERATOR_MODEL_NAME)
     except Exception as e:
         print("CRITICAL: Failed to load generator model.")
         print(f"Error: {e}")
         return
 
+    # Compile the generator's decode step (static KV cache + CUDA graphs)
+    generator_warmed_up = False
+    if components.device == "cuda":
+        try:
+            components.generator_executor.submit(
+                compile_generator,
+                components.generator_tokenizer,
+                components.generator_model,
+            ).result()
+            generator_warmed_up = True
+            print("Generator compiled with torch.compile (reduce-overhead).")
+        except Exception as e:
+            print("WARNING: Failed to compile generator; using eager mode.")
+            print(f"Error: {e}")
+
     # Load Translation Models
     print("Loading translation models...")
 
     # Turkish → English
     try:
-        components.translator_tr_en_tokenizer = AutoTokenizer.from_pretrained(
-            "Helsinki-NLP/opus-mt-tr-en",
-            use_fast=False,
-        )
-        components.translator_tr_en_model = AutoModelForSeq2SeqLM.from_pretrained(
-            "Helsinki-NLP/opus-mt-tr-en",
-        ).to("cpu")
+        (
+            components.translator_tr_en_tokenizer,
+            components.translator_tr_en_model,
+        ) = load_translator(TRANSLATOR_TR_EN_MODEL_NAME, TRANSLATOR_TR_EN_CT2_DIR)
         print("Loaded TR→EN translator.")
     except Exception as e:
         print(
@@ -139,13 +228,10 @@ def initialize_components():
 
     # English → Turkish
     try:
-        components.translator_en_tr_tokenizer = AutoTokenizer.from_pretrained(
-            "Helsinki-NLP/opus-mt-en-trk",
-            use_fast=False,
-        )
-        components.translator_en_tr_model = AutoModelForSeq2SeqLM.from_pretrained(
-            "Helsinki-NLP/opus-mt-en-trk",
-        ).to("cpu")
+        (
+            components.translator_en_tr_tokenizer,
+            components.translator_en_tr_model,
+        ) = load_translator(TRANSLATOR_EN_TR_MODEL_NAME, TRANSLATOR_EN_TR_CT2_DIR)
         print("Loaded EN→TR translator.")
     except Exception as e:
         print(
@@ -154,9 +240,190 @@ def initialize_components():
         )
         print(f"Error: {e}")
 
+    # Warm up kernels so the first request doesn't pay JIT/autotune costs
+    try:
+        warmup_components(
+            warm_generator=components.device == "cuda" and not generator_warmed_up
+        )
+        print("Warmup done.")
+    except Exception as e:
+        print("WARNING: Warmup failed; the first request may be slow.")
+        print(f"Error: {e}")
+
     print("--- All components initialized successfully ---")
 
 
+@app.on_event("startup")
+async def start_generator_worker():
+    """
+    Start the background task that runs all generator calls, so blocking
+    model.generate never runs on the event loop.
+    """
+    components.request_queue = asyncio.Queue()
+    components.generator_task = asyncio.create_task(
+        generator_loop(components.request_queue)
+    )
+
+
+@app.on_event("shutdown")
+async def stop_generator_worker():
+    if components.generator_task is not None:
+        components.generator_task.cancel()
+    components.generator_executor.shutdown(wait=False)
+
+
+async def generator_loop(queue: asyncio.Queue):
+    """
+    Take one request from the queue, collect more for a short window
+    (up to GENERATOR_MAX_BATCH_SIZE), and answer them with a single batched
+    generate call on the generator thread.
+    """
+    while True:
+        batch = [await queue.get()]
+
+        while len(batch) < GENERATOR_MAX_BATCH_SIZE:
+            try:
+                batch.append(
+                    await asyncio.wait_for(
+                        queue.get(), timeout=GENERATOR_BATCH_WINDOW_SECONDS
+                    )
+                )
+            except asyncio.TimeoutError:
+                break
+
+        prompts = [prompt for prompt, _ in batch]
+        try:
+            answers = await asyncio.get_running_loop().run_in_executor(
+                components.generator_executor,
+                generate_answers,
+                prompts,
+                components.generator_tokenizer,
+                components.generator_model,
+                components.device,
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            continue
+
+        for (_, future), answer in zip(batch, answers):
+            if not future.done():
+                future.set_result(answer)
+
+
+async def submit_prompt(prompt: List[int]) -> str:
+    """Queue a prompt for the generator worker and wait for its answer."""
+    if components.request_queue is None:
+        raise HTTPException(status_code=500, detail="API not initialized correctly.")
+
+    future = asyncio.get_running_loop().create_future()
+    await components.request_queue.put((prompt, future))
+    return await future
+
+
+def compile_generator(tokenizer, model) -> None:
+    """
+    Use a static KV cache and torch.compile the forward pass so the decode
+    loop is captured into CUDA graphs, then warm up every input shape a
+    request can produce, so compilation happens at startup instead of on
+    live requests. Restores the eager model if compilation or warmup fails.
+    """
+    eager_forward = model.forward
+    eager_cache_implementation = model.generation_config.cache_implementation
+
+    model.generation_config.cache_implementation = "static"
+    model.forward = torch.compile(eager_forward, mode="reduce-overhead", fullgraph=True)
+    components.generator_compiled = True
+
+    try:
+        warmup_generator(tokenizer, model, all_shapes=True)
+    except Exception:
+        model.forward = eager_forward
+        model.generation_config.cache_implementation = eager_cache_implementation
+        components.generator_compiled = False
+        raise
+
+
+def generator_warmup_shapes():
+    """
+    All (prompt length, batch size) pairs generate_answers can produce:
+    prompt lengths padded to PROMPT_PAD_MULTIPLE, batch sizes rounded to
+    powers of two up to GENERATOR_MAX_BATCH_SIZE.
+    """
+    batch_sizes = sorted(
+        {padded_batch_size(n) for n in range(1, GENERATOR_MAX_BATCH_SIZE + 1)}
+    )
+    for length in range(PROMPT_PAD_MULTIPLE, PROMPT_MAX_TOKENS + 1, PROMPT_PAD_MULTIPLE):
+        for batch_size in batch_sizes:
+            yield length, batch_size
+
+
+def warmup_generator(tokenizer, model, all_shapes: bool = False) -> None:
+    """
+    Run dummy generations through generate_answers, i.e. with the same
+    padding, token budget and decoding settings as real requests.
+    With all_shapes, every shape from generator_warmup_shapes is run
+    (needed for compiled CUDA graphs); otherwise only the largest prompt.
+    """
+    shapes = list(generator_warmup_shapes())
+    if not all_shapes:
+        shapes = [(PROMPT_MAX_TOKENS, 1)]
+
+    filler_id = tokenizer("warmup", add_special_tokens=False).input_ids[0]
+    for length, batch_size in shapes:
+        generate_answers(
+            [[filler_id] * length] * batch_size,
+            tokenizer,
+            model,
+            components.device,
+        )
+
+
+def warmup_components(warm_generator: bool = True) -> None:
+    """
+    Run one dummy embed, translation and (optionally, on GPU) generation
+    so cuBLAS autotuning and kernel JIT happen at startup.
+    """
+    components.embedding_model.encode(["warmup " * 50], normalize_embeddings=True)
+
+    # Bypass the translation cache so the models actually run
+    components.translation_cache.clear()
+    translate_batch(["Merhaba dünya."], "tr", "en")
+    translate_batch(["Hello world."], "en", "tr")
+    components.translation_cache.clear()
+
+    if warm_generator:
+        components.generator_executor.submit(
+            warmup_generator,
+            components.generator_tokenizer,
+            components.generator_model,
+        ).result()
+
+
+def load_translator(model_name: str, ct2_dir: str):
+    """
+    Load a Helsinki-NLP translator on CPU.
+    Uses the CTranslate2 int8 conversion in ct2_dir if it exists,
+    otherwise the HF Transformers model.
+    """
+    tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=False)
+
+    if ctranslate2 is not None and os.path.isdir(ct2_dir):
+        model = ctranslate2.Translator(
+            ct2_dir,
+            device="cpu",
+            compute_type="int8",
+            intra_threads=os.cpu_count() or 0,
+            inter_threads=2,
+        )
+        print(f"Using CTranslate2 int8 translator: {ct2_dir}")
+    else:
+        model = AutoModelForSeq2SeqLM.from_pretrained(model_name).to("cpu")
+
+    return tokenizer, model
+
+
 class SourceInfo(BaseModel):
     source: str
     page: Optional[int] = None
@@ -165,71 +432,144 @@ class SourceInfo(BaseModel):
     lang: Optional[str] = None
 
 
-def retrieve_context(query, collection, model, n_results: int = 5):
+def retrieve_context(query, collection, model, n_results: int = 5, query_embedding=None):
     """
     Retrieve relevant chunks from ChromaDB.
+    If query_embedding is given, it is used instead of re-encoding the query.
     Returns:
       - context_chunks: list[str]
-      - sources: list[SourceInfo-like dict]
+      - sources: list[SourceInfo-like dict], first entry is the top chunk's
+      - top_match: (cosine similarity, metadata) of the top chunk, or None
     """
     if collection is None or model is None:
         raise HTTPException(status_code=500, detail="API not initialized correctly.")
 
-    query_embedding = model.encode(
-        query,
-        convert_to_tensor=False,
-        normalize_embeddings=True,
-    ).tolist()
+    if query_embedding is None:
+        query_embedding = encode_query(query, model)
 
     results = collection.query(
-        query_embeddings=[query_embedding],
+        query_embeddings=np.asarray([query_embedding], dtype=np.float32),
         n_results=n_results,
+        include=["documents", "metadatas", "distances"],
     )
 
     context_chunks = results.get("documents", [[]])[0]
     metadatas = results.get("metadatas", [[]])[0]
+    distances = results.get("distances", [[]])[0]
+
+    top_match = None
+    if distances and metadatas:
+        space = (collection.metadata or {}).get("hnsw:space", "l2")
+        top_match = (distance_to_similarity(distances[0], space), metadatas[0])
+
+    # Dedupe sources by their metadata key, keeping first-seen order
+    keys = dict.fromkeys(
+        (
+            meta.get("source", "Unknown"),
+            meta.get("page"),
+            meta.get("paragraph"),
+            meta.get("type"),
+            meta.get("lang"),
+        )
+        for meta in metadatas
+    )
+    sources: List[dict] = [
+        {
+            "source": src,
+            "page": page,
+            "paragraph": paragraph,
+            "type": section_type,
+            "lang": lang,
+        }
+        for src, page, paragraph, section_type, lang in keys
+    ]
 
-    sources: List[dict] = []
-    seen = set()
+    return context_chunks, sources, top_match
 
-    for meta in metadatas:
-        src = meta.get("source", "Unknown")
-        page = meta.get("page")
-        paragraph = meta.get("paragraph")
-        section_type = meta.get("type")
-        lang = meta.get("lang")
 
-        key = (src, page, paragraph, section_type, lang)
-        if key in seen:
-            continue
-        seen.add(key)
-
-        sources.append(
-            {
-                "source": src,
-                "page": page,
-                "paragraph": paragraph,
-                "type": section_type,
-                "lang": lang,
-            }
-        )
-
-    return context_chunks, sources
+def distance_to_similarity(distance: float, space: str) -> float:
+    """
+    Convert a Chroma distance to cosine similarity.
+    Embeddings are normalized, so squared L2 distance is 2 - 2 * cos.
+    """
+    if space in ("cosine", "ip"):
+        return 1.0 - distance
+    return 1.0 - distance / 2.0
 
 
-def detect_lang(text: str) -> str:
+def faq_answer(meta: dict) -> Optional[str]:
     """
-    Heuristic language detection:
-    - If text looks like English (common English words), return 'en' even.
-    - Otherwise, if it contains Turkish-specific characters, return 'tr'.
-    - Default to 'en'.
+    Return the answer of an FAQ chunk if it is safe to send as-is:
+    parsed as a question/answer pair, and the answer is a complete
+    sentence rather than a question or a fragment cut off mid-line.
     """
-    if not text:
-        return "en"
+    if meta.get("type") != "faq":
+        return None
+
+    answer = (meta.get("answer") or "").strip()
+    if not answer or not answer.endswith((".", "!")):
+        return None
+    return answer
+
+
+def encode_query(query: str, model) -> np.ndarray:
+    """Encode a query into a normalized float32 embedding."""
+    return np.asarray(
+        model.encode(
+            query,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        ),
+        dtype=np.float32,
+    )
 
-    lower = text.lower()
 
-    english_keywords = {
+def lookup_query_cache(query: str, query_embedding: np.ndarray):
+    """
+    Return the cached (context_chunks, sources, answer) of the most similar
+    previous query if its cosine similarity is above QUERY_CACHE_THRESHOLD
+    and it was asked in the same language, otherwise None.
+    """
+    cache = components.query_cache
+    if not cache:
+        return None
+
+    if components.query_cache_matrix is None:
+        components.query_cache_keys = list(cache.keys())
+        components.query_cache_matrix = np.stack([entry[0] for entry in cache.values()])
+
+    sims = components.query_cache_matrix @ query_embedding
+    best = int(np.argmax(sims))
+    if sims[best] < QUERY_CACHE_THRESHOLD:
+        return None
+
+    cached_query = components.query_cache_keys[best]
+    if detect_lang(cached_query) != detect_lang(query):
+        return None
+
+    cache.move_to_end(cached_query)
+    _, context_chunks, sources, answer = cache[cached_query]
+    return context_chunks, sources, answer
+
+
+def store_query_cache(
+    query: str,
+    query_embedding: np.ndarray,
+    context_chunks: List[str],
+    sources: List[dict],
+    answer: str,
+) -> None:
+    """Insert a query result into the LRU semantic cache."""
+    cache = components.query_cache
+    cache[query] = (query_embedding, context_chunks, sources, answer)
+    cache.move_to_end(query)
+    while len(cache) > QUERY_CACHE_SIZE:
+        cache.popitem(last=False)
+    components.query_cache_matrix = None
+
+
+_EN_KEYWORDS = frozenset(
+    {
         "who",
         "what",
         "where",
@@ -259,26 +599,40 @@ def detect_lang(text: str) -> str:
         "application",
         "requirements",
     }
+)
+
+# Deletes Turkish-specific characters; a length change means some were present
+_TR_CHARS = str.maketrans("", "", "çğıöşüÇĞİÖŞÜ")
+
 
-    tokens = re.findall(r"[a-zA-Z]+", lower)
+@lru_cache(maxsize=4096)
+def detect_lang(text: str) -> str:
+    """
+    Heuristic language detection:
+    - If text looks like English (common English words), return 'en' even.
+    - Otherwise, if it contains Turkish-specific characters, return 'tr'.
+    - Default to 'en'.
+    """
+    if not text:
+        return "en"
 
-    if any(tok in english_keywords for tok in tokens):
+    if any(tok.strip(".,?!:;\"'()") in _EN_KEYWORDS for tok in text.lower().split()):
         return "en"
 
-    turkish_chars = set("çğıöşüÇĞİÖŞÜ")
-    if any(c in turkish_chars for c in text):
+    if len(text.translate(_TR_CHARS)) != len(text):
         return "tr"
 
     return "en"
 
 
-def translate_text(text: str, src_lang: str, tgt_lang: str) -> str:
+def translate_batch(texts: List[str], src_lang: str, tgt_lang: str) -> List[str]:
     """
-    Translate text between TR and EN using Helsinki-NLP models.
-    If the correct translator isn't loaded, just return the original text.
+    Translate several texts in the same direction with a single padded
+    tokenizer call and a single generate call.
+    If the correct translator isn't loaded, just return the original texts.
     """
-    if not text or src_lang == tgt_lang:
-        return text
+    if not texts or src_lang == tgt_lang:
+        return list(texts)
 
     if src_lang == "tr" and tgt_lang == "en":
         tok = components.translator_tr_en_tokenizer
@@ -287,14 +641,34 @@ def translate_text(text: str, src_lang: str, tgt_lang: str) -> str:
         tok = components.translator_en_tr_tokenizer
         model = components.translator_en_tr_model
     else:
-        return text
+        return list(texts)
 
     if tok is None or model is None:
-        return text
+        return list(texts)
+
+    cache = components.translation_cache
+    keys = [(_text_key(text), src_lang, tgt_lang) for text in texts]
+    missing = [i for i, key in enumerate(keys) if key not in cache]
+
+    if missing:
+        batch = [texts[i] for i in missing]
+        if ctranslate2 is not None and isinstance(model, ctranslate2.Translator):
+            decoded = _translate_batch_ct2(tok, model, batch)
+        else:
+            decoded = _translate_batch_hf(tok, model, batch)
+
+        for i, translated in zip(missing, decoded):
+            cache[keys[i]] = translated.strip()
+
+    return [cache[key] for key in keys]
 
+
+def _translate_batch_hf(tok, model, texts: List[str]) -> List[str]:
+    """Translate a batch with an HF Transformers seq2seq model."""
     inputs = tok(
-        text,
+        texts,
         return_tensors="pt",
+        padding=True,
         truncation=True,
         max_length=512,
     ).to("cpu")
@@ -303,87 +677,334 @@ def translate_text(text: str, src_lang: str, tgt_lang: str) -> str:
         outputs = model.generate(
             **inputs,
             max_new_tokens=256,
+            num_beams=1,
         )
 
-    return tok.decode(outputs[0], skip_special_tokens=True).strip()
+    return tok.batch_decode(outputs, skip_special_tokens=True)
+
+
+def _translate_batch_ct2(tok, translator, texts: List[str]) -> List[str]:
+    """Translate a batch with a CTranslate2 translator."""
+    source_tokens = [
+        tok.convert_ids_to_tokens(tok.encode(text, truncation=True, max_length=512))
+        for text in texts
+    ]
+
+    results = translator.translate_batch(
+        source_tokens,
+        max_decoding_length=256,
+        beam_size=1,
+    )
+
+    return [
+        tok.decode(
+            tok.convert_tokens_to_ids(result.hypotheses[0]),
+            skip_special_tokens=True,
+        )
+        for result in results
+    ]
+
+
+def _text_key(text: str) -> str:
+    """Short stable hash of a text, used as translation cache key."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def translate_chunks(context_chunks: List[str], question_lang: str) -> List[str]:
+    """
+    Translate retrieved chunks into the question language.
+    Chunks are partitioned by direction in one pass, each direction is
+    translated as one batch, and results are put back in the original order.
+    """
+    translated_chunks = list(context_chunks)
+
+    # (src, tgt) -> indices of chunks needing that direction
+    pending = {("tr", "en"): [], ("en", "tr"): []}
+    for i, chunk in enumerate(context_chunks):
+        chunk_lang = detect_lang(chunk)
+        direction = (chunk_lang, question_lang)
+        if direction in pending:
+            pending[direction].append(i)
+
+    for (src, tgt), indices in pending.items():
+        if not indices:
+            continue
+        batch = [context_chunks[i] for i in indices]
+        for i, translated in zip(indices, translate_batch(batch, src, tgt)):
+            translated_chunks[i] = translated
+
+    return translated_chunks
 
 
 FALLBACK_MESSAGE = "I'm sorry, I don't have that information in my knowledge base."
 
 
-def build_prompt(query: str, context_chunks: List[str]) -> str:
+LANGUAGE_RULES = {
+    "en": "The user has asked this question in English, so you MUST answer in clear English.\n",
+    "tr": "The user has asked this question in Turkish, so you MUST answer in clear Turkish.\n",
+}
+
+# Static parts of the prompt; their token ids are cached at startup.
+# Segments split right after a newline so the concatenated ids match
+# tokenizing the whole prompt at once.
+PROMPT_HEAD = (
+    "You are an assistant for Abdullah Gül University (AGU).\n"
+    "You answer questions ONLY using the information in the context below.\n\n"
+    "RULES:\n"
+    "1. Use ONLY the information inside <context> ... </context>.\n"
+    "2. Do NOT invent new facts.\n"
+    "3. {language_rule}"
+    "4. Answer the question DIRECTLY and CONCISELY in 1–3 sentences.\n"
+    "5. Do NOT give advice unless the question explicitly asks for advice.\n"
+    "6. Do NOT talk about the context or about being an AI.\n\n"
+    "<context>\n"
+)
+PROMPT_SUFFIX = "Answer:"
+
+PROMPT_MAX_TOKENS = 1024
+# Prompts are padded to a multiple of this, giving PROMPT_MAX_TOKENS // 256 shapes
+PROMPT_PAD_MULTIPLE = 256
+
+# Answers are 1–3 sentences: stop after the third one, and give long
+# prompts a smaller token budget
+ANSWER_MAX_SENTENCES = 3
+ANSWER_MAX_NEW_TOKENS = 96
+LONG_PROMPT_TOKENS = 768
+LONG_PROMPT_MAX_NEW_TOKENS = 48
+
+# Abbreviations whose trailing "." is not a sentence end
+_ABBREVIATIONS = ("Dr", "Prof", "Doç", "Mr", "Mrs", "Ms", "St", "vs")
+
+# A sentence terminator (plus optional closing quote/bracket) followed by
+# whitespace, directly after a word of two or more letters or a closing
+# quote/bracket. So "2.5", "1. ", "e.g. ", "A. " and "Dr. " don't count.
+_SENTENCE_END_RE = re.compile(
+    r"(?:(?<=[^\W\d_]{2})|(?<=[\"'”’)\]]))"
+    + "".join(rf"(?<!\b{abbr})" for abbr in _ABBREVIATIONS)
+    + r"[.!?。][\"'”’)\]]?(?=\s)"
+)
+
+
+def cache_prompt_template_ids(tokenizer) -> None:
+    """Tokenize the static prompt head (per language) and suffix once."""
+    components.prompt_head_ids = {
+        lang: tokenizer(PROMPT_HEAD.format(language_rule=rule)).input_ids
+        for lang, rule in LANGUAGE_RULES.items()
+    }
+    components.prompt_suffix_ids = tokenizer(
+        PROMPT_SUFFIX, add_special_tokens=False
+    ).input_ids
+    components.prompt_newline_ids = tokenizer(
+        "\n", add_special_tokens=False
+    ).input_ids
+
+
+def build_prompt(query: str, context_chunks: List[str]) -> List[int]:
+    """
+    Build the generator prompt as token ids.
+    Only the context and question are tokenized per request; the static
+    head and suffix ids come from cache_prompt_template_ids. The total never
+    exceeds PROMPT_MAX_TOKENS: the context is truncated first, and only a
+    question that alone is too long gets cut (keeping the trailing newline
+    and the "Answer:" suffix).
+    """
+    tokenizer = components.generator_tokenizer
+    if tokenizer is None or components.prompt_head_ids is None:
+        raise HTTPException(status_code=500, detail="API not initialized correctly.")
+
     context = "\n\n".join(context_chunks) if context_chunks else ""
-    q_lang = detect_lang(query)
+    head_ids = components.prompt_head_ids[detect_lang(query)]
+    suffix_ids = components.prompt_suffix_ids
 
-    language_rule = (
-        "The user has asked this question in English, so you MUST answer in clear English.\n"
-        if q_lang == "en"
-        else "The user has asked this question in Turkish, so you MUST answer in clear Turkish.\n"
-    )
+    context_ids, question_ids = tokenizer(
+        [f"{context}\n", f"</context>\n\nQuestion: {query}\n"],
+        add_special_tokens=False,
+    ).input_ids
 
-    prompt = (
-        "You are an assistant for Abdullah Gül University (AGU).\n"
-        "You answer questions ONLY using the information in the context below.\n\n"
-        "RULES:\n"
-        "1. Use ONLY the information inside <context> ... </context>.\n"
-        "2. Do NOT invent new facts.\n"
-        f"3. {language_rule}"
-        "4. Answer the question DIRECTLY and CONCISELY in 1–3 sentences.\n"
-        "5. Do NOT give advice unless the question explicitly asks for advice.\n"
-        "6. Do NOT talk about the context or about being an AI.\n\n"
-        "<context>\n"
-        f"{context}\n"
-        "</context>\n\n"
-        f"Question: {query}\n"
-        "Answer:"
-    )
-    return prompt
+    question_budget = PROMPT_MAX_TOKENS - len(head_ids) - len(suffix_ids)
+    if len(question_ids) > question_budget:
+        newline_ids = components.prompt_newline_ids
+        question_ids = question_ids[: question_budget - len(newline_ids)] + newline_ids
+
+    budget = question_budget - len(question_ids)
+    context_ids = context_ids[:budget]
+
+    return head_ids + context_ids + question_ids + suffix_ids
+
+
+# Everything up to and including the first "answer:" (case-insensitive)
+_ANSWER_RE = re.compile(r"^.*?answer:\s*", re.IGNORECASE | re.DOTALL)
+_OPEN_QUOTES = ('"', "“")
+_CLOSE_QUOTES = ('"', "”")
 
 
 def clean_generated_answer(raw: str) -> str:
-    text = raw.strip()
+    return strip_quotes(_ANSWER_RE.sub("", raw.strip(), count=1))
 
-    lower = text.lower()
-    idx = lower.find("answer:")
-    if idx != -1:
-        text = text[idx + len("answer:") :].strip()
 
-    if text.startswith(('"', "“")) and text.endswith(('"', "”")):
+def strip_quotes(text: str) -> str:
+    text = text.strip()
+    while len(text) > 1 and text[:1] in _OPEN_QUOTES and text[-1:] in _CLOSE_QUOTES:
         text = text[1:-1].strip()
 
     return text
 
 
-def generate_answer(prompt: str, tokenizer, model, device: str) -> str:
+def generate_answers(prompts: List[List[int]], tokenizer, model, device: str) -> List[str]:
+    """
+    Generate short, factual answers for a batch of prompts (token ids).
+    Prompts are grouped by their own token budget and each group runs as
+    one (left-padded) generate call, so a long prompt never shrinks the
+    budget of the short prompts batched with it.
+    """
+    if tokenizer is None or model is None:
+        raise HTTPException(status_code=500, detail="API not initialized correctly.")
+
+    groups = {}
+    for i, prompt in enumerate(prompts):
+        groups.setdefault(answer_token_budget(len(prompt)), []).append(i)
+
+    answers = [""] * len(prompts)
+    for max_new_tokens, indices in groups.items():
+        rows = [prompts[i] for i in indices]
+        if components.generator_compiled:
+            # Round the batch up to a warmed-up size; filler rows are discarded
+            rows += [rows[0]] * (padded_batch_size(len(rows)) - len(rows))
+        inputs = pad_prompts(rows, tokenizer)
+
+        with torch.inference_mode():
+            output_sequences = model.generate(
+                **inputs,
+                **generation_kwargs(tokenizer, inputs.input_ids.shape[1], max_new_tokens),
+            )
+
+        raw_answers = tokenizer.batch_decode(output_sequences, skip_special_tokens=True)
+        for i, raw in zip(indices, raw_answers):
+            answers[i] = trim_to_sentences(clean_generated_answer(raw))
+
+    return answers
+
+
+def stream_answer(prompt: List[int], tokenizer, model):
     """
-    Generate a short, factual answer.
+    Yield answer text pieces as they are generated.
+    model.generate runs on the generator thread feeding a TextIteratorStreamer,
+    queued behind any batch already running there.
     """
     if tokenizer is None or model is None:
         raise HTTPException(status_code=500, detail="API not initialized correctly.")
 
+    inputs = pad_prompts([prompt], tokenizer)
+    streamer = TextIteratorStreamer(
+        tokenizer,
+        skip_prompt=True,
+        skip_special_tokens=True,
+        timeout=STREAM_TIMEOUT_SECONDS,
+    )
+    errors = []
+
+    def run_generate():
+        try:
+            with torch.inference_mode():
+                model.generate(
+                    **inputs,
+                    **generation_kwargs(
+                        tokenizer,
+                        inputs.input_ids.shape[1],
+                        answer_token_budget(len(prompt)),
+                    ),
+                    streamer=streamer,
+                )
+        except Exception as e:
+            errors.append(e)
+        finally:
+            # Always unblock the consumer, also when generate fails
+            streamer.end()
+
+    components.generator_executor.submit(run_generate)
+    yield from streamer
+
+    if errors:
+        raise errors[0]
+
+
+def pad_prompts(prompts: List[List[int]], tokenizer):
+    """
+    Left-pad prompt token ids into a batch on the generator's device.
+    For the compiled generator, lengths are rounded up to a multiple of
+    PROMPT_PAD_MULTIPLE so only a few input shapes exist (all of them
+    warmed up at startup); eager mode pads only to the longest prompt.
+    """
     input_device = "cuda" if torch.cuda.is_available() else "cpu"
 
-    inputs = tokenizer(
-        prompt,
+    return tokenizer.pad(
+        {"input_ids": prompts},
+        padding=True,
+        pad_to_multiple_of=PROMPT_PAD_MULTIPLE if components.generator_compiled else None,
         return_tensors="pt",
-        truncation=True,
-        max_length=1024,
     ).to(input_device)
 
-    with torch.inference_mode():
-        output_sequences = model.generate(
-            **inputs,
-            max_new_tokens=96,
-            temperature=0.0,
-            top_p=1.0,
-            do_sample=False,
-            no_repeat_ngram_size=4,
-            repetition_penalty=1.1,
-            eos_token_id=tokenizer.eos_token_id,
+
+def padded_batch_size(n: int) -> int:
+    """Round a batch size up to the next power of two."""
+    return 1 << (n - 1).bit_length()
+
+
+class SentenceStoppingCriteria(StoppingCriteria):
+    """
+    Stops each sequence once its generated text has max_sentences complete
+    sentences. Returns one flag per batch row.
+    """
+
+    def __init__(self, tokenizer, prompt_length: int, max_sentences: int):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.max_sentences = max_sentences
+
+    def __call__(self, input_ids, scores, **kwargs):
+        texts = self.tokenizer.batch_decode(
+            input_ids[:, self.prompt_length :], skip_special_tokens=True
         )
+        return torch.tensor(
+            [len(_SENTENCE_END_RE.findall(text)) >= self.max_sentences for text in texts],
+            dtype=torch.bool,
+            device=input_ids.device,
+        )
+
+
+def trim_to_sentences(text: str, max_sentences: int = ANSWER_MAX_SENTENCES) -> str:
+    """Cut text after its max_sentences-th sentence terminator."""
+    ends = list(_SENTENCE_END_RE.finditer(text))
+    if len(ends) < max_sentences:
+        return text
+    return text[: ends[max_sentences - 1].end()]
+
+
+def answer_token_budget(prompt_length: int) -> int:
+    """Max new tokens for a prompt of this (unpadded) length."""
+    if prompt_length > LONG_PROMPT_TOKENS:
+        return LONG_PROMPT_MAX_NEW_TOKENS
+    return ANSWER_MAX_NEW_TOKENS
+
 
-    raw_answer = tokenizer.decode(output_sequences[0], skip_special_tokens=True)
-    return clean_generated_answer(raw_answer)
+def generation_kwargs(tokenizer, prompt_length: int, max_new_tokens: int) -> dict:
+    """
+    Decoding settings shared by batched and streaming generation.
+    prompt_length is the padded input length, where generated tokens start.
+    """
+    return {
+        "max_new_tokens": max_new_tokens,
+        "stopping_criteria": StoppingCriteriaList(
+            [SentenceStoppingCriteria(tokenizer, prompt_length, ANSWER_MAX_SENTENCES)]
+        ),
+        "temperature": 0.0,
+        "top_p": 1.0,
+        "do_sample": False,
+        "no_repeat_ngram_size": 4,
+        "repetition_penalty": 1.1,
+        "eos_token_id": tokenizer.eos_token_id,
+        "pad_token_id": tokenizer.pad_token_id,
+    }
 
 
 # --- API Endpoints ---
@@ -404,58 +1025,156 @@ def get_root():
     return {"status": "RAG API is running."}
 
 
+async def prepare_chat(query: str):
+    """
+    Run everything before generation: cache lookup, retrieval, direct FAQ
+    match and context translation.
+    Returns (response, prompt, query_embedding, context_chunks, sources);
+    response is a finished ChatResponse when no generation is needed,
+    otherwise None and prompt is ready for the generator.
+    """
+    if components.embedding_model is None:
+        raise HTTPException(status_code=500, detail="API not initialized correctly.")
+
+    # Encode the query once; reused for the cache lookup and retrieval
+    query_embedding = await asyncio.to_thread(
+        encode_query, query, components.embedding_model
+    )
+
+    cached = lookup_query_cache(query, query_embedding)
+    if cached is not None:
+        print("Semantic cache hit; returning cached answer.")
+        _, cached_sources, cached_answer = cached
+        response = ChatResponse(answer=cached_answer, sources=cached_sources)
+        return response, None, query_embedding, [], cached_sources
+
+    # Retrieve original context from Chroma
+    context_chunks, sources_raw, top_match = await asyncio.to_thread(
+        retrieve_context,
+        query,
+        components.db_collection,
+        components.embedding_model,
+        query_embedding=query_embedding,
+    )
+
+    if not context_chunks:
+        print("No context retrieved; returning fallback directly.")
+        response = ChatResponse(answer=FALLBACK_MESSAGE, sources=[])
+        return response, None, query_embedding, [], []
+
+    # Detect user language
+    question_lang = detect_lang(query)
+    print(f"Detected question language: {question_lang}")
+
+    # Near-exact FAQ match: return the FAQ answer itself, no LLM call
+    direct_answer = None
+    if top_match is not None and top_match[0] >= DIRECT_ANSWER_THRESHOLD:
+        direct_answer = faq_answer(top_match[1])
+
+    if direct_answer is not None:
+        print(f"Direct FAQ match (similarity {top_match[0]:.3f}); skipping generator.")
+        answer = (
+            await asyncio.to_thread(translate_chunks, [direct_answer], question_lang)
+        )[0]
+        direct_sources = sources_raw[:1]
+        store_query_cache(query, query_embedding, context_chunks, direct_sources, answer)
+        response = ChatResponse(answer=answer, sources=direct_sources)
+        return response, None, query_embedding, context_chunks, direct_sources
+
+    # Translate chunks into the question language (batched per direction)
+    translated_chunks = await asyncio.to_thread(
+        translate_chunks, context_chunks, question_lang
+    )
+
+    # Optional debug
+    if translated_chunks:
+        print("\n=== FIRST ORIGINAL CHUNK ===\n", context_chunks[0][:400])
+        print("\n=== FIRST TRANSLATED CHUNK ===\n", translated_chunks[0][:400])
+
+    prompt = build_prompt(query, translated_chunks)
+    return None, prompt, query_embedding, context_chunks, sources_raw
+
+
 @app.post("/chat", response_model=ChatResponse)
 async def chat_with_rag(request: ChatRequest):
     try:
-        # Retrieve original context from Chroma
-        context_chunks, sources_raw = retrieve_context(
-            request.query,
-            components.db_collection,
-            components.embedding_model,
+        response, prompt, query_embedding, context_chunks, sources_raw = (
+            await prepare_chat(request.query)
         )
+        if response is not None:
+            return response
 
-        if not context_chunks:
-            print("No context retrieved; returning fallback directly.")
-            return ChatResponse(answer=FALLBACK_MESSAGE, sources=[])
+        # Generation runs on the worker, batched with concurrent requests
+        answer = await submit_prompt(prompt)
 
-        # Detect user language
-        question_lang = detect_lang(request.query)
-        print(f"Detected question language: {question_lang}")
+        store_query_cache(
+            request.query, query_embedding, context_chunks, sources_raw, answer
+        )
 
-        # Translate each chunk if needed
-        translated_chunks: List[str] = []
-        for chunk in context_chunks:
-            chunk_lang = detect_lang(chunk)
+        return ChatResponse(answer=answer, sources=sources_raw)
 
-            if question_lang == "en" and chunk_lang == "tr":
-                translated = translate_text(chunk, "tr", "en")
-            elif question_lang == "tr" and chunk_lang == "en":
-                translated = translate_text(chunk, "en", "tr")
-            else:
-                translated = chunk
+    except Exception as e:
+        print(f"Error during chat: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-            translated_chunks.append(translated)
 
-        # Optional debug
-        if translated_chunks:
-            print("\n=== FIRST ORIGINAL CHUNK ===\n", context_chunks[0][:400])
-            print("\n=== FIRST TRANSLATED CHUNK ===\n", translated_chunks[0][:400])
+def sse_event(payload: dict) -> str:
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
 
-        prompt = build_prompt(request.query, translated_chunks)
 
-        answer = generate_answer(
-            prompt,
-            components.generator_tokenizer,
-            components.generator_model,
-            components.device,
+@app.post("/chat/stream")
+async def chat_with_rag_stream(request: ChatRequest):
+    """
+    Same pipeline as /chat, but the answer is streamed as Server-Sent Events:
+    {"delta": ...} events while generating, then one final
+    {"answer": ..., "sources": [...]} event.
+    """
+    try:
+        response, prompt, query_embedding, context_chunks, sources_raw = (
+            await prepare_chat(request.query)
         )
-
-        return ChatResponse(answer=answer, sources=sources_raw)
-
     except Exception as e:
         print(f"Error during chat: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+    # Async generator: the blocking streamer is read via to_thread, while the
+    # query cache is only touched on the event loop, like in /chat
+    async def events():
+        if response is not None:
+            yield sse_event({"delta": response.answer})
+            yield sse_event(jsonable_encoder(response))
+            return
+
+        pieces = []
+        try:
+            stream = stream_answer(
+                prompt,
+                components.generator_tokenizer,
+                components.generator_model,
+            )
+            while True:
+                piece = await asyncio.to_thread(next, stream, None)
+                if piece is None:
+                    break
+                # The streamer emits "" while it buffers a partial word
+                if not piece:
+                    continue
+                pieces.append(piece)
+                yield sse_event({"delta": piece})
+        except Exception as e:
+            print(f"Error during chat stream: {e}")
+            yield sse_event({"error": str(e)})
+            return
+
+        # The streamer skips the prompt, so there is no "Answer:" prefix to cut
+        answer = trim_to_sentences(strip_quotes("".join(pieces)))
+        store_query_cache(
+            request.query, query_embedding, context_chunks, sources_raw, answer
+        )
+        yield sse_event({"answer": answer, "sources": sources_raw})
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
 
 if __name__ == "__main__":
     import uvicorn
@@ -87,6 +87,8 @@ def chunk_documents(documents):
                 "paragraph": doc.get('paragraph'),
                 "type": doc.get('type'),
                 "lang": doc.get('lang'),
+                # FAQ entries: the answer alone, returned directly by the API
+                "answer": doc.get('answer'),
             }
 
             metadata = {k: v for k, v in meta_raw.items() if v is not None}
@@ -112,8 +114,11 @@ def initialize_vector_db(db_dir, collection_name, embedding_model):
     db_client = chromadb.PersistentClient(path=db_dir)
 
     print(f"Getting or creating ChromaDB collection: {collection_name}")
+    # Embeddings are normalized, so inner product equals cosine similarity
+    # (only applies when the collection is created; delete vector_db to rebuild)
     collection = db_client.get_or_create_collection(
-        name=collection_name
+        name=collection_name,
+        metadata={"hnsw:space": "ip"},
     )
     return collection
 
@@ -148,35 +153,28 @@ def embed_and_store(collection, chunks, model, batch_size=32):
     all_texts = [chunk["text"] for chunk in chunks]
 
     # For BGE-m3, it's recommended to normalize embeddings
+    # Returned as one contiguous (N, d) float32 array
     all_embeddings = model.encode(
         all_texts,
         batch_size=batch_size,
         show_progress_bar=True,
+        output_value="sentence_embedding",
+        convert_to_numpy=True,
         normalize_embeddings=True,
     )
 
     print("Adding embeddings to the vector database...")
 
-    embedding_lists = [emb.tolist() for emb in all_embeddings]
     metadatas = [chunk["metadata"] for chunk in chunks]
     ids = [chunk["id"] for chunk in chunks]
-    documents_to_store = all_texts
-
-    total_chunks = len(ids)
-    for i in range(0, total_chunks, batch_size):
-        batch_end = min(i + batch_size, total_chunks)
-
-        batch_ids = ids[i:batch_end]
-        batch_embeddings = embedding_lists[i:batch_end]
-        batch_metadatas = metadatas[i:batch_end]
-        batch_docs = documents_to_store[i:batch_end]
-
-        collection.add(
-            embeddings=batch_embeddings,
-            documents=batch_docs,
-            metadatas=batch_metadatas,
-            ids=batch_ids
-        )
+
+    # Single bulk insert; Chroma accepts the (N, d) ndarray directly
+    collection.add(
+        embeddings=all_embeddings,
+        documents=all_texts,
+        metadatas=metadatas,
+        ids=ids
+    )
 
     print("...Embeddings added successfully.")
 
@@ -1,6 +1,8 @@
 import os
+import re
 import json
 import glob
+import multiprocessing
 import docx  # For .docx files
 import fitz  # PyMuPDF for .pdf files
 
@@ -10,6 +12,12 @@ DOCS_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'faq_docs')
 OUTPUT_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
 OUTPUT_FILE = os.path.join(OUTPUT_DIR, 'parsed_faqs.json')
 
+# Documents laid out as numbered question/answer pairs
+FAQ_DOCUMENTS = {'FAQ about course selection.pdf'}
+
+# "1. Can I ..." starts a new FAQ item
+FAQ_ITEM_RE = re.compile(r'^\d+\.\s')
+
 
 def parse_docx(file_path):
     """
@@ -47,7 +55,8 @@ def parse_pdf(file_path):
     Each block becomes a separate JSON entry.
     """
     print(f"Parsing PDF: {os.path.basename(file_path)}")
-    data = []
+    source = os.path.basename(file_path)
+    blocks = []
     try:
         doc = fitz.open(file_path)
 
@@ -65,17 +74,86 @@ def parse_pdf(file_path):
 
                 # Only add non-empty strings that have meaningful content
                 if cleaned_text and len(cleaned_text) > 10:  # Avoid headers/footers
-                    data.append({
-                        "source": os.path.basename(file_path),
-                        "content": cleaned_text
-                    })
+                    blocks.append(cleaned_text)
 
         doc.close()
     except Exception as e:
         print(f"Error parsing {file_path}: {e}")
+
+    if source in FAQ_DOCUMENTS:
+        return group_faq_blocks(blocks, source)
+    return [{"source": source, "content": text} for text in blocks]
+
+
+def continues_question(question, block):
+    """
+    PDF blocks split questions across lines. The next block still belongs
+    to the question if it starts lowercase, supplies the missing '?',
+    or closes an open parenthesis.
+    """
+    if block[:1].islower():
+        return True
+    if '?' not in question and block.endswith('?'):
+        return True
+    return question.count('(') > question.count(')') and ')' in block
+
+
+def group_faq_blocks(blocks, source):
+    """
+    Groups the text blocks of a numbered FAQ into question/answer entries.
+    Each entry's content is the question and answer together (for
+    retrieval); the answer alone is kept in the 'answer' field.
+    Blocks before the first question stay separate entries.
+    """
+    data = []
+    i = 0
+
+    while i < len(blocks):
+        if not FAQ_ITEM_RE.match(blocks[i]):
+            data.append({"source": source, "content": blocks[i]})
+            i += 1
+            continue
+
+        question = blocks[i]
+        i += 1
+        while i < len(blocks) and not FAQ_ITEM_RE.match(blocks[i]) and continues_question(question, blocks[i]):
+            question = f"{question} {blocks[i]}"
+            i += 1
+
+        answer_blocks = []
+        while i < len(blocks) and not FAQ_ITEM_RE.match(blocks[i]):
+            answer_blocks.append(blocks[i])
+            i += 1
+
+        if not answer_blocks:
+            data.append({"source": source, "content": question})
+            continue
+
+        answer = ' '.join(answer_blocks)
+        data.append({
+            "source": source,
+            "content": f"{question}\n{answer}",
+            "type": "faq",
+            "answer": answer,
+        })
+
     return data
 
 
+def parse_one(file_path):
+    """
+    Parses a single document, dispatching on its extension.
+    Runs inside a worker process.
+    """
+    file_ext = os.path.splitext(file_path)[1].lower()
+
+    if file_ext == '.docx':
+        return parse_docx(file_path)
+    elif file_ext == '.pdf':
+        return parse_pdf(file_path)
+    return []
+
+
 def main():
     """
     Main function to find all documents, parse them,
@@ -96,15 +174,12 @@ def main():
         return
 
     print(f"Found {len(all_files)} documents to parse...")
-    all_data = []
 
-    for file_path in all_files:
-        file_ext = os.path.splitext(file_path)[1].lower()
+    # Parse files in parallel; results keep the order of all_files
+    with multiprocessing.Pool(min(os.cpu_count() or 1, len(all_files))) as pool:
+        results = pool.map(parse_one, all_files)
 
-        if file_ext == '.docx':
-            all_data.extend(parse_docx(file_path))
-        elif file_ext == '.pdf':
-            all_data.extend(parse_pdf(file_path))
+    all_data = [entry for file_data in results for entry in file_data]
 
     # Save the combined data to the output file
     try:
@@ -1,6 +1,8 @@
-import time
-import requests
-from bs4 import BeautifulSoup
+import asyncio
+from collections import defaultdict
+from urllib.parse import urlparse
+import httpx
+from bs4 import BeautifulSoup, SoupStrainer
 import json
 import os
 
@@ -90,6 +92,9 @@ SITES_TO_SCRAPE = [
 OUTPUT_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
 OUTPUT_FILE = os.path.join(OUTPUT_DIR, 'scraped_content.json')
 
+# Politeness: requests to the same host run one at a time, this far apart
+REQUEST_DELAY_SECONDS = 1
+
 # Headers to mimic a real browser
 HEADERS = {
     'User-Agent': (
@@ -100,7 +105,7 @@ HEADERS = {
 }
 
 
-def scrape_site(url, tag, class_name, lang=None):
+async def scrape_site(client, url, tag, class_name, lang=None):
     """
     Scrapes a single website, finds the main content block, and then
     extracts text from all relevant sub-tags (p, li, h1-h6).
@@ -110,17 +115,22 @@ def scrape_site(url, tag, class_name, lang=None):
     """
     print(f"Scraping: {url}")
     try:
-        # Use verify=False to ignore SSL certificate errors
-        response = requests.get(url, headers=HEADERS, timeout=10, verify=False)
+        response = await client.get(url)
         response.raise_for_status()
-    except requests.exceptions.SSLError as e:
-        print(f"SSL Error for {url}. Bypassed with verify=False. Error: {e}")
-        return []
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"Error scraping {url}: {e}")
         return []
 
-    soup = BeautifulSoup(response.content, 'html.parser')
+    return extract_content(response.content, url, tag, class_name, lang)
+
+
+def extract_content(html, url, tag, class_name, lang=None):
+    """
+    Extracts the text entries from the main content block of a page.
+    """
+    # Only build the tree for the main content block
+    strainer = SoupStrainer(tag, class_=class_name)
+    soup = BeautifulSoup(html, 'lxml', parse_only=strainer)
 
     # Find the main content block
     content_block = soup.find(tag, class_=class_name)
@@ -168,27 +178,53 @@ def scrape_site(url, tag, class_name, lang=None):
     return data
 
 
+async def scrape_site_polite(client, site, host_semaphore):
+    """
+    Scrapes a site while holding its host's semaphore, so requests to the
+    same host are serialized and spaced out.
+    """
+    async with host_semaphore:
+        data = await scrape_site(
+            client,
+            site['url'],
+            site['tag'],
+            site['class_name'],
+            lang=site.get('lang'),
+        )
+        await asyncio.sleep(REQUEST_DELAY_SECONDS)
+    return data
+
+
+async def scrape_all(sites):
+    """
+    Scrapes all sites concurrently over one HTTP/2 client.
+    Distinct hosts run in parallel; results keep the order of sites.
+    """
+    # Use verify=False to ignore SSL certificate errors
+    async with httpx.AsyncClient(
+        http2=True,
+        headers=HEADERS,
+        timeout=10,
+        verify=False,
+        follow_redirects=True,
+    ) as client:
+        host_semaphores = defaultdict(lambda: asyncio.Semaphore(1))
+        return await asyncio.gather(*(
+            scrape_site_polite(client, site, host_semaphores[urlparse(site['url']).netloc])
+            for site in sites
+        ))
+
+
 def main():
     """
     Main function to orchestrate the scraping process.
     """
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-    all_data = []
     print(f"Starting web scraping for {len(SITES_TO_SCRAPE)} site(s)...")
 
-    # Disable SSL warnings from requests
-    requests.packages.urllib3.disable_warnings(requests.packages.urllib3.exceptions.InsecureRequestWarning)
-
-    for site in SITES_TO_SCRAPE:
-        scraped_data = scrape_site(
-            site['url'],
-            site['tag'],
-            site['class_name'],
-            lang=site.get('lang'),
-        )
-        all_data.extend(scraped_data)
-        time.sleep(1)
+    results = asyncio.run(scrape_all(SITES_TO_SCRAPE))
+    all_data = [entry for site_data in results for entry in site_data]
 
     # Save the combined data to the output file
     try: